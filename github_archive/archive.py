@@ -1,19 +1,28 @@
+import asyncio
 import logging
 import os
 import shutil
 import subprocess
+import tarfile
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-from threading import BoundedSemaphore, Thread
 
+import requests
 from github import Github
 
-from github_archive.constants import DEFAULT_LOCATION, DEFAULT_NUM_THREADS, DEFAULT_TIMEOUT
+from github_archive import graphql
+from github_archive.cache import setup_api_cache
+from github_archive.constants import DEFAULT_CLONE_DEPTH, DEFAULT_LOCATION, DEFAULT_NUM_THREADS, DEFAULT_TIMEOUT
 from github_archive.logger import Logger
 
 LOGGER = logging.getLogger(__name__)
 
 CLONE_OPERATION = 'clone'
 PULL_OPERATION = 'pull'
+TARBALL_OPERATION = 'tarball'
 
 GIST_CONTEXT = 'gist'
 ORG_CONTEXT = 'org'
@@ -21,6 +30,48 @@ PERSONAL_CONTEXT = 'personal'
 STAR_CONTEXT = 'star'
 USER_CONTEXT = 'user'
 
+# Partial clones skip downloading the object history that archives rarely need,
+# git lazily fetches any filtered objects later if they are ever required
+CLONE_DEPTH_ARGS = {
+    'full': [],
+    'blobless': ['--filter=blob:none'],
+    'treeless': ['--filter=tree:0'],
+    'shallow': ['--depth=1', '--single-branch'],
+}
+
+PREFETCH_STORE_DIRNAME = '.multi.git'
+# ~50 remotes per `git fetch --multiple` keeps arg lists well below OS limits
+PREFETCH_BATCH_SIZE = 50
+# Object filters applied to the prefetch store's remotes so the shared fetch honors
+# `--clone-depth`; `shallow` has no filter equivalent so it skips the prefetch
+CLONE_DEPTH_FILTERS = {
+    'full': None,
+    'blobless': 'blob:none',
+    'treeless': 'tree:0',
+}
+
+# Listing calls for different owners run concurrently, capped low enough to stay
+# friendly with GitHub's secondary rate limits
+MAX_LIST_WORKERS = 8
+
+LAST_RUN_FILENAME = '.last_run'
+
+# Parallelism inside each git process, stacked on top of the outer worker pool:
+# protocol v2 shrinks the ref advertisement on repos with many refs, and the
+# fetch settings parallelize multi-remote and submodule object downloads
+GIT_CONFIG_ARGS = [
+    '-c',
+    'protocol.version=2',
+    '-c',
+    'fetch.parallel=4',
+    '-c',
+    'submodule.fetchJobs=4',
+]
+
+TRASH_DIRNAME = '.trash'
+# How often the background reaper sweeps the trash dir for directories to delete
+TRASH_REAP_INTERVAL = 30
+
 
 class GithubArchive:
     def __init__(
@@ -28,6 +79,7 @@ class GithubArchive:
         view=False,
         clone=False,
         pull=False,
+        tarball=False,
         forks=False,
         users=None,
         orgs=None,
@@ -37,24 +89,34 @@ class GithubArchive:
         threads=DEFAULT_NUM_THREADS,
         token=None,
         location=DEFAULT_LOCATION,
+        clone_depth=DEFAULT_CLONE_DEPTH,
     ):
         # Parameter variables
         self.view = view
         self.clone = clone
         self.pull = pull
+        self.tarball = tarball
         self.forks = forks
-        self.users = users.lower().split(',') if users else ''
-        self.orgs = orgs.lower().split(',') if orgs else ''
-        self.gists = gists.lower().split(',') if gists else ''
-        self.stars = stars.lower().split(',') if stars else ''
+        self.users = self._parse_owner_list(users)
+        self.orgs = self._parse_owner_list(orgs)
+        self.gists = self._parse_owner_list(gists)
+        self.stars = self._parse_owner_list(stars)
         self.timeout = timeout
         self.threads = threads
         self.token = token
         self.location = location
+        self.clone_depth = clone_depth
         # Internal variables
-        self.github_instance = Github(self.token) if self.token else Github()
+        # `per_page=100` is GitHub's max and cuts REST pagination round-trips ~3.3x
+        self.github_instance = Github(self.token, per_page=100) if self.token else Github(per_page=100)
         self.authenticated_user = self.github_instance.get_user() if self.token else None
         self.authenticated_username = self.authenticated_user.login.lower() if self.token else None
+        # Gate writing `.last_run`: only a pull pass that completes without per-repo
+        # failures may record a run, since pulls are the operation the timestamp
+        # gates; recording clone/view/tarball runs could make a later pull skip
+        # repos whose local copies are still stale or missing
+        self._ran_pull_pass = False
+        self._archive_failures = 0
 
     def run(self):
         """Run the tool based on the arguments passed via the CLI."""
@@ -62,21 +124,21 @@ class GithubArchive:
         Logger.setup_logging(LOGGER, self.location)
         LOGGER.info('# GitHub Archive started...\n')
         start_time = datetime.now()
+        # `.last_run` records when the listings were taken (UTC to match `pushed_at`),
+        # not when the run finished, so pushes landing mid-run aren't skipped next time
+        run_started_at = datetime.utcnow()
+
+        # Personal and user repos are coalesced into one deduped batch keyed by owner
+        # and name, so a repo surfaced by both passes is only archived once
+        repos_to_archive = {}
+        fetched_user_repos = False
 
         # Personal (includes personal authenticated items)
-        if self.token and self.authenticated_user_in_users and self.users:
+        if self.token and self.users and self.authenticated_user_in_users():
             LOGGER.info('# Making API call to GitHub for personal repos...\n')
-            personal_repos = self.get_all_git_assets(PERSONAL_CONTEXT)
-
-            if self.view:
-                LOGGER.info('# Viewing user repos...\n')
-                self.view_repos(personal_repos)
-            if self.clone:
-                LOGGER.info('# Cloning missing personal repos...\n')
-                self.iterate_repos_to_archive(personal_repos, PERSONAL_CONTEXT, CLONE_OPERATION)
-            if self.pull:
-                LOGGER.info('# Pulling changes to personal repos...\n')
-                self.iterate_repos_to_archive(personal_repos, PERSONAL_CONTEXT, PULL_OPERATION)
+            for repo in self.get_all_git_assets(PERSONAL_CONTEXT):
+                repos_to_archive[(repo.owner.login.lower(), repo.name.lower())] = repo
+            fetched_user_repos = True
 
             # We remove the authenticated user from the list so that we don't double pull their
             # repos for the `users` logic.
@@ -85,7 +147,12 @@ class GithubArchive:
         # Users (can include personal non-authenticated items, excludes personal authenticated calls)
         if self.users and len(self.users) > 0:
             LOGGER.info('# Making API calls to GitHub for user repos...\n')
-            user_repos = self.get_all_git_assets(USER_CONTEXT)
+            for repo in self.get_all_git_assets(USER_CONTEXT):
+                repos_to_archive[(repo.owner.login.lower(), repo.name.lower())] = repo
+            fetched_user_repos = True
+
+        if fetched_user_repos:
+            user_repos = list(repos_to_archive.values())
 
             if self.view:
                 LOGGER.info('# Viewing user repos...\n')
@@ -96,6 +163,9 @@ class GithubArchive:
             if self.pull:
                 LOGGER.info('# Pulling changes to user repos...\n')
                 self.iterate_repos_to_archive(user_repos, USER_CONTEXT, PULL_OPERATION)
+            if self.tarball:
+                LOGGER.info('# Downloading tarball snapshots of user repos...\n')
+                self.iterate_repos_to_archive(user_repos, USER_CONTEXT, TARBALL_OPERATION)
 
         # Orgs
         if self.orgs:
@@ -111,6 +181,9 @@ class GithubArchive:
             if self.pull:
                 LOGGER.info('# Pulling changes to org repos...\n')
                 self.iterate_repos_to_archive(org_repos, ORG_CONTEXT, PULL_OPERATION)
+            if self.tarball:
+                LOGGER.info('# Downloading tarball snapshots of org repos...\n')
+                self.iterate_repos_to_archive(org_repos, ORG_CONTEXT, TARBALL_OPERATION)
 
         # Gists
         if self.gists:
@@ -137,10 +210,16 @@ class GithubArchive:
                 self.view_repos(starred_repos)
             if self.clone:
                 LOGGER.info('# Cloning missing starred repos...\n')
-                self.iterate_repos_to_archive(starred_repos, CLONE_OPERATION)
+                self.iterate_repos_to_archive(starred_repos, STAR_CONTEXT, CLONE_OPERATION)
             if self.pull:
                 LOGGER.info('# Pulling changes to starred repos...\n')
-                self.iterate_repos_to_archive(starred_repos, PULL_OPERATION)
+                self.iterate_repos_to_archive(starred_repos, STAR_CONTEXT, PULL_OPERATION)
+            if self.tarball:
+                LOGGER.info('# Downloading tarball snapshots of starred repos...\n')
+                self.iterate_repos_to_archive(starred_repos, STAR_CONTEXT, TARBALL_OPERATION)
+
+        if self._ran_pull_pass and not self._archive_failures:
+            self._write_last_run(run_started_at)
 
         execution_time = f'Execution time: {datetime.now() - start_time}.'
         finish_message = f'GitHub Archive complete! {execution_time}\n'
@@ -157,27 +236,58 @@ class GithubArchive:
             os.makedirs(os.path.join(self.location, 'repos'))
             os.makedirs(os.path.join(self.location, 'gists'))
 
-        if (self.users or self.orgs or self.gists or self.stars) and not (self.view or self.clone or self.pull):
+        if (self.users or self.orgs or self.gists or self.stars) and not (
+            self.view or self.clone or self.pull or self.tarball
+        ):
             message = 'A git operation must be specified when a list of users or orgs is provided.'
             LOGGER.critical(message)
             raise ValueError(message)
-        elif not (self.users or self.orgs or self.gists or self.stars) and (self.view or self.clone or self.pull):
+        elif not (self.users or self.orgs or self.gists or self.stars) and (
+            self.view or self.clone or self.pull or self.tarball
+        ):
             message = 'A list must be provided when a git operation is specified.'
             LOGGER.critical(message)
             raise ValueError(message)
+        elif self.clone_depth not in CLONE_DEPTH_ARGS:
+            message = f'The clone depth must be one of: {", ".join(CLONE_DEPTH_ARGS)}.'
+            LOGGER.critical(message)
+            raise ValueError(message)
+
+        os.makedirs(os.path.join(self.location, TRASH_DIRNAME), exist_ok=True)
+        self._start_trash_reaper()
+        setup_api_cache(self.github_instance, self.location)
 
     def authenticated_user_in_users(self):
-        return self.authenticated_user.login.lower() in self.users
+        return self.authenticated_username in self.users
+
+    @staticmethod
+    def _parse_owner_list(owners):
+        """Parse a comma separated owner string into a deduped list (order preserved),
+        tolerating stray whitespace and trailing commas so duplicate names don't each
+        trigger a full listing pass.
+        """
+        if not owners:
+            return []
+
+        return list(dict.fromkeys(owner.strip() for owner in owners.lower().split(',') if owner.strip()))
 
     def get_all_git_assets(self, context):
         """Retrieve a list of lists via API of git assets (repos, gists) of the
         specified owner(s) (users, orgs). Return a sorted, flat, sorted list of git assets.
         """
-        get_org_repos = lambda owner: self.github_instance.get_organization(owner).get_repos()  # noqa
-        get_personal_repos = lambda owner: self.authenticated_user.get_repos(affiliation='owner')  # noqa
+        if self.token:
+            # GraphQL returns only the fields we read, one request per 100 assets instead
+            # of one request per 30 full REST payloads
+            get_org_repos = lambda owner: graphql.get_repos(self.token, owner)  # noqa
+            get_user_gists = lambda owner: graphql.get_gists(self.token, owner)  # noqa
+            get_user_repos = lambda owner: graphql.get_repos(self.token, owner)  # noqa
+        else:
+            # GraphQL requires authentication, fall back to paginated REST without a token
+            get_org_repos = lambda owner: self.github_instance.get_organization(owner).get_repos()  # noqa
+            get_user_gists = lambda owner: self.github_instance.get_user(owner).get_gists()  # noqa
+            get_user_repos = lambda owner: self.github_instance.get_user(owner).get_repos()  # noqa
+        get_personal_repos = lambda owner: self.authenticated_user.get_repos(type='owner', sort='pushed', direction='desc')  # noqa
         get_starred_repos = lambda owner: self.github_instance.get_user(owner).get_starred()  # noqa
-        get_user_gists = lambda owner: self.github_instance.get_user(owner).get_gists()  # noqa
-        get_user_repos = lambda owner: self.github_instance.get_user(owner).get_repos()  # noqa
 
         context_manager = {
             GIST_CONTEXT: [self.gists, get_user_gists, 'gists'],
@@ -189,12 +299,16 @@ class GithubArchive:
 
         all_git_assets = []
         owner_list = context_manager[context][0]
+        asset_getter = context_manager[context][1]
         git_asset_string = context_manager[context][2]
 
-        for owner in owner_list:
-            formatted_owner_name = owner.strip()
-            git_assets = context_manager[context][1](owner)
-            LOGGER.debug(f'{formatted_owner_name} {git_asset_string} retrieved!')
+        # Fan the per-owner API calls out across a small pool instead of serializing
+        # each owner's pagination end-to-end behind the previous owner's
+        with ThreadPoolExecutor(max_workers=min(MAX_LIST_WORKERS, max(len(owner_list), 1))) as pool:
+            owner_git_assets = list(pool.map(lambda owner: list(asset_getter(owner)), owner_list))
+
+        for owner, git_assets in zip(owner_list, owner_git_assets):
+            LOGGER.debug(f'{owner} {git_asset_string} retrieved!')
 
             for item in git_assets:
                 if self.forks or (self.forks is False and item.fork is False):
@@ -208,47 +322,64 @@ class GithubArchive:
         return final_sorted_list
 
     def iterate_repos_to_archive(self, repos, context, operation):
-        """Iterate over each repository and start a thread if it can be archived."""
-        thread_limiter = BoundedSemaphore(self.threads)
-        thread_list = []
+        """Iterate over each repository and archive it concurrently.
 
-        for repo in repos:
-            repo_owner_username = repo.owner.login.lower()
-            repo_path = os.path.join(self.location, 'repos', repo_owner_username, repo.name)
-            repo_thread = Thread(
-                target=self.archive_repo,
-                args=(
-                    thread_limiter,
-                    repo,
-                    repo_path,
-                    operation,
-                ),
-            )
-            thread_list.append(repo_thread)
-            repo_thread.start()
-        for thread in thread_list:
-            thread.join()
+        Concurrency is bounded by a semaphore of `self.threads` so we never run more
+        than that many git processes at once; the event loop tends the child processes
+        instead of one blocked OS thread per child.
+        """
+        if operation == PULL_OPERATION:
+            self._ran_pull_pass = True
+
+        asyncio.run(self._archive_repos(repos, operation))
+
+    async def _archive_repos(self, repos, operation):
+        if operation == PULL_OPERATION:
+            last_run = self._read_last_run()
+            if last_run:
+                # Repos that haven't been pushed since the last successful run can't
+                # have anything new to pull
+                repos = [repo for repo in repos if self._pushed_since(repo, last_run)]
+
+        semaphore = asyncio.Semaphore(self.threads)
+        existing_repo_paths = self._snapshot_existing_repos(repos)
+
+        if operation == CLONE_OPERATION:
+            # Prefetch the repos about to be cloned into the shared store so each
+            # clone borrows its objects locally via `--reference-if-able`
+            repos_to_clone = [repo for repo in repos if self._repo_path(repo) not in existing_repo_paths]
+            if repos_to_clone:
+                await self._prefetch_repos(repos_to_clone)
+
+        async def archive_repo_with_limit(repo, repo_path):
+            async with semaphore:
+                await self.archive_repo(repo, repo_path, operation, repo_path in existing_repo_paths)
+
+        await asyncio.gather(
+            *(archive_repo_with_limit(repo, self._repo_path(repo)) for repo in repos)
+        )
+
+    def _repo_path(self, repo):
+        return os.path.join(self.location, 'repos', repo.owner.login.lower(), repo.name)
 
     def iterate_gists_to_archive(self, gists, operation):
-        """Iterate over each gist and start a thread if it can be archived."""
-        thread_limiter = BoundedSemaphore(self.threads)
-        thread_list = []
+        """Iterate over each gist and archive it concurrently."""
+        asyncio.run(self._archive_gists(gists, operation))
 
-        for gist in gists:
-            gist_path = os.path.join(self.location, 'gists', gist.id)
-            gist_thread = Thread(
-                target=self.archive_gist,
-                args=(
-                    thread_limiter,
-                    gist,
-                    gist_path,
-                    operation,
-                ),
+    async def _archive_gists(self, gists, operation):
+        semaphore = asyncio.Semaphore(self.threads)
+        existing_gist_paths = self._snapshot_existing_dirs(os.path.join(self.location, 'gists'))
+
+        async def archive_gist_with_limit(gist, gist_path):
+            async with semaphore:
+                await self.archive_gist(gist, gist_path, operation, gist_path in existing_gist_paths)
+
+        await asyncio.gather(
+            *(
+                archive_gist_with_limit(gist, os.path.join(self.location, 'gists', gist.id))
+                for gist in gists
             )
-            thread_list.append(gist_thread)
-            gist_thread.start()
-        for thread in thread_list:
-            thread.join()
+        )
 
     def view_repos(self, repos):
         """View a list of repos that will be cloned/pulled."""
@@ -262,74 +393,407 @@ class GithubArchive:
             gist_id = f'{gist.owner.login}/{gist.id}'
             LOGGER.info(gist_id)
 
-    def archive_repo(self, thread_limiter, repo, repo_path, operation):
+    async def archive_repo(self, repo, repo_path, operation, already_exists):
         """Clone and pull repos based on the operation passed"""
-        if (os.path.exists(repo_path) and operation == CLONE_OPERATION) or (
-            not os.path.exists(repo_path) and operation == PULL_OPERATION
-        ):
+        if (already_exists and operation == CLONE_OPERATION) or (not already_exists and operation == PULL_OPERATION):
             pass
+        elif operation == TARBALL_OPERATION:
+            # Snapshots don't involve git at all; run the blocking download on a
+            # worker thread so it doesn't stall the event loop
+            await asyncio.get_event_loop().run_in_executor(None, self._download_tarball, repo, repo_path)
+        elif operation == PULL_OPERATION and await self._repo_up_to_date(repo, repo_path):
+            LOGGER.debug(f'Repo: {repo.owner.login}/{repo.name} is already up to date.')
         else:
             commands = {
-                CLONE_OPERATION: f'git clone {repo.ssh_url} {repo_path}',
-                PULL_OPERATION: f'cd {repo_path} && git pull --rebase',
+                CLONE_OPERATION: [
+                    'git',
+                    *GIT_CONFIG_ARGS,
+                    'clone',
+                    *CLONE_DEPTH_ARGS[self.clone_depth],
+                    *self._clone_reference_args(),
+                    repo.ssh_url,
+                    repo_path,
+                ],
+                PULL_OPERATION: ['git', *GIT_CONFIG_ARGS, 'pull', '--rebase'],
             }
             git_command = commands[operation]
 
             try:
-                thread_limiter.acquire()
-                subprocess.run(
-                    git_command,
-                    stdout=subprocess.DEVNULL,
-                    stdin=subprocess.DEVNULL,
-                    stderr=subprocess.DEVNULL,
-                    shell=True,
-                    check=True,
-                    timeout=self.timeout,
-                )
+                await self._run_git(git_command, cwd=repo_path if operation == PULL_OPERATION else None)
                 LOGGER.info(f'Repo: {repo.owner.login}/{repo.name} {operation} success!')
-            except subprocess.TimeoutExpired:
+            except asyncio.TimeoutError:
                 LOGGER.error(f'Git operation timed out archiving {repo.name}.')
-                if os.path.exists(repo_path):
-                    shutil.rmtree(repo_path)
+                self._archive_failures += 1
+                self._cleanup_failed_archive(repo_path)
             except subprocess.CalledProcessError as error:
                 LOGGER.error(f'Failed to {operation} {repo.name}\n{error}')
-                if os.path.exists(repo_path):
-                    shutil.rmtree(repo_path)
-            finally:
-                thread_limiter.release()
+                self._archive_failures += 1
+                self._cleanup_failed_archive(repo_path)
 
-    def archive_gist(self, thread_limiter, gist, gist_path, operation):
+    async def archive_gist(self, gist, gist_path, operation, already_exists):
         """Clone and pull gists based on the operation passed"""
-        if (os.path.exists(gist_path) and operation == CLONE_OPERATION) or (
-            not os.path.exists(gist_path) and operation == PULL_OPERATION
-        ):
+        if (already_exists and operation == CLONE_OPERATION) or (not already_exists and operation == PULL_OPERATION):
             pass
         else:
             commands = {
-                CLONE_OPERATION: f'git clone {gist.html_url} {gist_path}',
-                PULL_OPERATION: f'cd {gist_path} && git pull --rebase',
+                CLONE_OPERATION: ['git', *GIT_CONFIG_ARGS, 'clone', gist.html_url, gist_path],
+                PULL_OPERATION: ['git', *GIT_CONFIG_ARGS, 'pull', '--rebase'],
             }
             git_command = commands[operation]
 
             try:
-                thread_limiter.acquire()
-                subprocess.run(
-                    git_command,
-                    stdout=subprocess.DEVNULL,
-                    stdin=subprocess.DEVNULL,
-                    stderr=subprocess.DEVNULL,
-                    shell=True,
-                    check=True,
-                    timeout=self.timeout,
-                )
+                await self._run_git(git_command, cwd=gist_path if operation == PULL_OPERATION else None)
                 LOGGER.info(f'Gist: {gist.owner.login}/{gist.id} {operation} success!')
-            except subprocess.TimeoutExpired:
+            except asyncio.TimeoutError:
                 LOGGER.error(f'Git operation timed out archiving {gist.id}.')
-                if os.path.exists(gist_path):
-                    shutil.rmtree(gist_path)
+                self._cleanup_failed_archive(gist_path)
             except subprocess.CalledProcessError as error:
                 LOGGER.error(f'Failed to {operation} {gist.id}\n{error}')
-                if os.path.exists(gist_path):
-                    shutil.rmtree(gist_path)
-            finally:
-                thread_limiter.release()
+                self._cleanup_failed_archive(gist_path)
+
+    async def _prefetch_repos(self, repos):
+        """Fetch the objects of the repos about to be cloned into a shared bare store
+        with a handful of `git fetch --multiple --jobs` invocations instead of one
+        process and one SSH session per repo; the clones then borrow those objects
+        via `--reference-if-able`. The prefetch is best-effort: any failure is logged
+        and the affected clones simply fetch individually as before.
+        """
+        if self.clone_depth not in CLONE_DEPTH_FILTERS:
+            # `--depth` can't be expressed as an object filter for the store; a full
+            # prefetch would defeat the point of a shallow clone
+            return
+
+        store_path = os.path.join(self.location, PREFETCH_STORE_DIRNAME)
+
+        try:
+            self._setup_prefetch_store(store_path, repos)
+        except OSError as error:
+            LOGGER.debug(f'Could not set up the prefetch store: {error}')
+            return
+
+        remote_names = [self._prefetch_remote_name(repo) for repo in repos]
+        for batch_start in range(0, len(remote_names), PREFETCH_BATCH_SIZE):
+            batch = remote_names[batch_start:batch_start + PREFETCH_BATCH_SIZE]
+            try:
+                await self._run_git(
+                    ['git', *GIT_CONFIG_ARGS, '-C', store_path, 'fetch', '--multiple', '--quiet']
+                    + [f'--jobs={self.threads}', *batch]
+                )
+            except (asyncio.TimeoutError, subprocess.CalledProcessError) as error:
+                LOGGER.debug(f'Prefetch batch failed, pulls will fetch individually: {error}')
+
+    def _setup_prefetch_store(self, store_path, repos):
+        """Lay out the shared store (a minimal bare repo) and write its remotes config
+        directly instead of paying one `git remote add` process per repo.
+        """
+        os.makedirs(os.path.join(store_path, 'objects'), exist_ok=True)
+        os.makedirs(os.path.join(store_path, 'refs'), exist_ok=True)
+
+        head_path = os.path.join(store_path, 'HEAD')
+        if not os.path.exists(head_path):
+            with open(head_path, 'w') as head_file:
+                head_file.write('ref: refs/heads/main\n')
+
+        clone_filter = CLONE_DEPTH_FILTERS.get(self.clone_depth)
+        config_lines = [
+            '[core]',
+            '\trepositoryformatversion = 0',
+            '\tbare = true',
+        ]
+        for repo in repos:
+            remote_name = self._prefetch_remote_name(repo)
+            config_lines += [
+                f'[remote "{remote_name}"]',
+                f'\turl = {repo.ssh_url}',
+                f'\tfetch = +refs/heads/*:refs/remotes/{remote_name}/*',
+                '\ttagOpt = --no-tags',
+            ]
+            if clone_filter:
+                # Promisor remotes make the store's fetches as partial as the clones
+                # that borrow from it instead of silently pulling full history
+                config_lines += [
+                    '\tpromisor = true',
+                    f'\tpartialclonefilter = {clone_filter}',
+                ]
+
+        with open(os.path.join(store_path, 'config'), 'w') as config_file:
+            config_file.write('\n'.join(config_lines) + '\n')
+
+    def _prefetch_remote_name(self, repo):
+        return f'{repo.owner.login.lower()}-{repo.name}'
+
+    def _clone_reference_args(self):
+        """Borrow objects already present in the shared prefetch store when cloning.
+
+        `--dissociate` copies the borrowed objects into the clone afterwards so the
+        archive stays fully independent of the store.
+        """
+        store_path = os.path.join(self.location, PREFETCH_STORE_DIRNAME)
+        if os.path.exists(store_path):
+            return ['--reference-if-able', store_path, '--dissociate']
+
+        return []
+
+    def _snapshot_existing_repos(self, repos):
+        """Take one directory listing per unique owner up front instead of paying a
+        stat syscall per repo inside the workers.
+        """
+        existing_repo_paths = set()
+        for owner_username in {repo.owner.login.lower() for repo in repos}:
+            existing_repo_paths |= self._snapshot_existing_dirs(os.path.join(self.location, 'repos', owner_username))
+
+        return existing_repo_paths
+
+    def _snapshot_existing_dirs(self, parent_dir):
+        try:
+            with os.scandir(parent_dir) as entries:
+                return {os.path.join(parent_dir, entry.name) for entry in entries}
+        except FileNotFoundError:
+            return set()
+
+    def _cleanup_failed_archive(self, path):
+        """Move a partially archived dir to the trash so the next run can retry it from
+        scratch. The rename is a metadata-only operation, so the worker slot frees up
+        immediately instead of blocking on a potentially huge recursive delete, which
+        the background reaper handles instead.
+        """
+        try:
+            os.rename(path, os.path.join(self.location, TRASH_DIRNAME, str(uuid.uuid4())))
+        except FileNotFoundError:
+            pass
+        except OSError:
+            # The trash dir is missing or on another filesystem, delete in place instead
+            shutil.rmtree(path, ignore_errors=True)
+
+    def _start_trash_reaper(self):
+        """Start a daemon thread that deletes trashed directories in the background,
+        including any left over from a previous run that exited mid-delete.
+        """
+        threading.Thread(target=self._reap_trash, daemon=True).start()
+
+    def _reap_trash(self):
+        trash_dir = os.path.join(self.location, TRASH_DIRNAME)
+
+        while True:
+            try:
+                with os.scandir(trash_dir) as entries:
+                    for entry in entries:
+                        shutil.rmtree(entry.path, ignore_errors=True)
+            except OSError:
+                pass
+            time.sleep(TRASH_REAP_INTERVAL)
+
+    def _download_tarball(self, repo, repo_path):
+        """Download and extract GitHub's precomputed tarball snapshot of a repo's
+        default branch — a single HTTP round-trip with no pack negotiation. An ETag
+        sidecar file lets subsequent runs receive `304 Not Modified` for unchanged
+        repos and skip the download entirely.
+        """
+        default_branch = getattr(repo, 'default_branch', None) or 'HEAD'
+        codeload_url = f'https://codeload.github.com/{repo.owner.login}/{repo.name}/tar.gz/{default_branch}'
+        etag_path = f'{repo_path}.etag'
+
+        headers = {}
+        if self.token:
+            headers['Authorization'] = f'token {self.token}'
+        try:
+            with open(etag_path) as etag_file:
+                headers['If-None-Match'] = etag_file.read().strip()
+        except OSError:
+            pass
+
+        try:
+            response = requests.get(codeload_url, headers=headers, stream=True, timeout=self.timeout)
+        except requests.RequestException as error:
+            LOGGER.error(f'Failed to download tarball of {repo.name}\n{error}')
+            return
+
+        if response.status_code == 304:
+            LOGGER.debug(f'Repo: {repo.owner.login}/{repo.name} tarball is already up to date.')
+            return
+        elif response.status_code != 200:
+            LOGGER.error(f'Failed to download tarball of {repo.name}, received HTTP {response.status_code}.')
+            return
+
+        tarball_path = f'{repo_path}.tar.gz'
+        os.makedirs(os.path.dirname(repo_path), exist_ok=True)
+        with open(tarball_path, 'wb') as tarball_file:
+            for chunk in response.iter_content(chunk_size=65536):
+                tarball_file.write(chunk)
+
+        with tarfile.open(tarball_path, 'r:gz') as tarball:
+            for member in tarball.getmembers():
+                # Strip the `<repo>-<sha>/` dir GitHub wraps tarballs in so contents
+                # land directly in the repo's archive dir
+                member.name = member.name.partition('/')[2]
+                if not member.name:
+                    continue
+                if not self._safe_tarball_member(member, repo_path):
+                    LOGGER.debug(f'Skipping unsafe tarball member of {repo.name}: {member.name}')
+                    continue
+                tarball.extract(member, repo_path)
+        os.remove(tarball_path)
+
+        etag = response.headers.get('ETag')
+        if etag:
+            with open(etag_path, 'w') as etag_file:
+                etag_file.write(etag)
+
+        LOGGER.info(f'Repo: {repo.owner.login}/{repo.name} {TARBALL_OPERATION} success!')
+
+    def _safe_tarball_member(self, member, repo_path):
+        """Guard against tar-slip: only regular files and dirs whose destination
+        resolves inside the repo dir get extracted. Symlinks (and anything else
+        exotic) are rejected since they could redirect later writes outside the tree.
+        """
+        if not (member.isreg() or member.isdir()):
+            return False
+
+        repo_root = os.path.realpath(repo_path)
+        destination = os.path.realpath(os.path.join(repo_root, member.name))
+
+        return destination == repo_root or destination.startswith(repo_root + os.sep)
+
+    def _pushed_since(self, repo, last_run):
+        """Check if a repo has been pushed to since the given timestamp. Repos whose
+        listing doesn't carry a `pushed_at` datetime are always considered pushed.
+        """
+        pushed_at = getattr(repo, 'pushed_at', None)
+        if not isinstance(pushed_at, datetime):
+            return True
+
+        return pushed_at >= last_run
+
+    def _read_last_run(self):
+        """Read the timestamp of the last successful run, if there was one."""
+        try:
+            with open(os.path.join(self.location, LAST_RUN_FILENAME)) as last_run_file:
+                return datetime.fromisoformat(last_run_file.read().strip())
+        except (OSError, ValueError):
+            return None
+
+    def _write_last_run(self, timestamp):
+        """Record a successful run so the next one can skip repos unchanged since."""
+        try:
+            with open(os.path.join(self.location, LAST_RUN_FILENAME), 'w') as last_run_file:
+                last_run_file.write(timestamp.isoformat())
+        except OSError as error:
+            LOGGER.debug(f'Could not record the last run timestamp: {error}')
+
+    def _git_env(self):
+        """Build the env for git subprocesses, enabling SSH connection multiplexing.
+
+        `ControlMaster`/`ControlPersist` let every git operation after the first reuse
+        one authenticated SSH connection per host instead of paying a fresh TCP +
+        handshake + auth round-trip each. Users who set their own `GIT_SSH_COMMAND`
+        keep it (returning `None` inherits the parent environment untouched).
+        """
+        if 'GIT_SSH_COMMAND' in os.environ:
+            return None
+
+        socket_dir = os.path.join(self.location, '.ssh_sockets')
+        os.makedirs(socket_dir, exist_ok=True)
+        ssh_command = (
+            'ssh -o ControlMaster=auto -o ControlPersist=600'
+            f' -o ControlPath={os.path.join(socket_dir, "cm-%r@%h:%p")}'
+        )
+
+        return {**os.environ, 'GIT_SSH_COMMAND': ssh_command}
+
+    async def _repo_up_to_date(self, repo, repo_path):
+        """Check if a local repo already has the remote HEAD sha so we can skip pulling
+        entirely, trading a full pull (pack negotiation, delta resolution, index refresh)
+        for a single ref advertisement. For daily archive runs most repos haven't changed,
+        making this the common path.
+        """
+        local_sha = self._local_head_sha(repo_path)
+        if not local_sha:
+            return False
+
+        # GraphQL listings already carry the remote tip oid, making this check free
+        remote_sha = getattr(repo, 'default_branch_oid', None) or await self._remote_head_sha(repo)
+
+        return remote_sha is not None and remote_sha == local_sha
+
+    def _local_head_sha(self, repo_path):
+        """Read the sha of the local HEAD straight from the repo's git files (no subprocess)."""
+        git_dir = os.path.join(repo_path, '.git')
+
+        try:
+            with open(os.path.join(git_dir, 'HEAD')) as head_file:
+                head = head_file.read().strip()
+        except OSError:
+            return None
+
+        if not head.startswith('ref: '):
+            # Detached HEAD, the file contains the sha itself
+            return head or None
+        ref = head[len('ref: '):]  # noqa
+
+        ref_path = os.path.join(git_dir, *ref.split('/'))
+        if os.path.exists(ref_path):
+            with open(ref_path) as ref_file:
+                return ref_file.read().strip() or None
+
+        try:
+            with open(os.path.join(git_dir, 'packed-refs')) as packed_refs_file:
+                for line in packed_refs_file:
+                    line = line.strip()
+                    if line.endswith(f' {ref}'):
+                        return line.split()[0]
+        except OSError:
+            pass
+
+        return None
+
+    async def _remote_head_sha(self, repo):
+        """Retrieve the sha of the remote HEAD via a ref advertisement (`git ls-remote`)."""
+        process = await asyncio.create_subprocess_exec(
+            'git',
+            'ls-remote',
+            repo.ssh_url,
+            'HEAD',
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.DEVNULL,
+            stdin=asyncio.subprocess.DEVNULL,
+            env=self._git_env(),
+        )
+
+        try:
+            stdout, _ = await asyncio.wait_for(process.communicate(), timeout=self.timeout)
+        except asyncio.TimeoutError:
+            process.kill()
+            await process.wait()
+            return None
+
+        if process.returncode != 0:
+            return None
+
+        output = stdout.decode().split()
+
+        return output[0] if output else None
+
+    async def _run_git(self, command, cwd=None):
+        """Run a git command in a subprocess without blocking a thread on it.
+
+        Raises `subprocess.CalledProcessError` when git exits non-zero and
+        `asyncio.TimeoutError` when the operation exceeds the configured timeout.
+        """
+        process = await asyncio.create_subprocess_exec(
+            *command,
+            stdout=asyncio.subprocess.DEVNULL,
+            stderr=asyncio.subprocess.DEVNULL,
+            stdin=asyncio.subprocess.DEVNULL,
+            cwd=cwd,
+            env=self._git_env(),
+        )
+
+        try:
+            await asyncio.wait_for(process.wait(), timeout=self.timeout)
+        except asyncio.TimeoutError:
+            process.kill()
+            await process.wait()
+            raise
+
+        if process.returncode != 0:
+            raise subprocess.CalledProcessError(returncode=process.returncode, cmd=command)
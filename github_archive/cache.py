@@ -0,0 +1,62 @@
+import atexit
+import logging
+import os
+import shelve
+import threading
+import urllib.parse
+
+LOGGER = logging.getLogger(__name__)
+
+CACHE_DIR_NAME = '.cache'
+
+
+def setup_api_cache(github_instance, location):
+    """Wrap PyGithub's requester with a persistent conditional-request cache.
+
+    GET requests are replayed with the `If-None-Match` header of the previously
+    seen `ETag`; when GitHub answers `304 Not Modified` (which costs zero rate
+    limit) we serve the stored response body instead of re-downloading it.
+    """
+    cache_dir = os.path.join(location, CACHE_DIR_NAME)
+
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        cache = shelve.open(os.path.join(cache_dir, 'github-api'))
+    except Exception as error:
+        # The cache is purely an optimization, never fail a run because of it
+        LOGGER.debug(f'Could not open the GitHub API cache: {error}')
+        return
+    atexit.register(cache.close)
+
+    requester = github_instance._Github__requester
+    uncached_request_encode = requester._Requester__requestEncode
+    # Listing calls fan out across a thread pool and `shelve` doesn't support
+    # concurrent access, so every cache read/write takes this lock
+    cache_lock = threading.Lock()
+
+    def cached_request_encode(cnx, verb, url, parameters, requestHeaders, input, encode):
+        if verb != 'GET':
+            return uncached_request_encode(cnx, verb, url, parameters, requestHeaders, input, encode)
+
+        cache_key = f'{url}?{urllib.parse.urlencode(parameters or {})}'
+        with cache_lock:
+            cached_response = cache.get(cache_key)
+        requestHeaders = dict(requestHeaders or {})
+        if cached_response:
+            requestHeaders['If-None-Match'] = cached_response['etag']
+
+        status, response_headers, output = uncached_request_encode(
+            cnx, verb, url, parameters, requestHeaders, input, encode
+        )
+
+        if status == 304 and cached_response:
+            return 200, cached_response['headers'], cached_response['output']
+
+        etag = response_headers.get('etag') or response_headers.get('ETag')
+        if status == 200 and etag:
+            with cache_lock:
+                cache[cache_key] = {'etag': etag, 'headers': response_headers, 'output': output}
+
+        return status, response_headers, output
+
+    requester._Requester__requestEncode = cached_request_encode
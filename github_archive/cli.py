@@ -1,7 +1,7 @@
 import argparse
 
 from github_archive import GithubArchive
-from github_archive.constants import DEFAULT_LOCATION, DEFAULT_NUM_THREADS, DEFAULT_TIMEOUT
+from github_archive.constants import DEFAULT_CLONE_DEPTH, DEFAULT_LOCATION, DEFAULT_NUM_THREADS, DEFAULT_TIMEOUT
 
 
 class GithubArchiveCli:
@@ -35,6 +35,14 @@ class GithubArchiveCli:
             default=False,
             help='Pass this flag to pull git assets.',
         )
+        parser.add_argument(
+            '-tb',
+            '--tarball',
+            action='store_true',
+            required=False,
+            default=False,
+            help='Pass this flag to download tarball snapshots of repos (no git involved).',
+        )
         parser.add_argument(
             '-f',
             '--forks',
@@ -102,6 +110,18 @@ class GithubArchiveCli:
                 ' gists.'
             ),
         )
+        parser.add_argument(
+            '-cd',
+            '--clone-depth',
+            type=str,
+            required=False,
+            default=DEFAULT_CLONE_DEPTH,
+            choices=['full', 'blobless', 'treeless', 'shallow'],
+            help=(
+                'How much git history to download when cloning. Partial clones (the default) skip most of the'
+                ' object history, dramatically reducing bandwidth and disk usage for large repos.'
+            ),
+        )
         parser.add_argument(
             '-l',
             '--location',
@@ -117,6 +137,7 @@ class GithubArchiveCli:
             view=self.view,
             clone=self.clone,
             pull=self.pull,
+            tarball=self.tarball,
             forks=self.forks,
             users=self.users,
             orgs=self.orgs,
@@ -126,6 +147,7 @@ class GithubArchiveCli:
             threads=self.threads,
             token=self.token,
             location=self.location,
+            clone_depth=self.clone_depth,
         )
         github_archive.run()
 
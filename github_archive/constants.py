@@ -1,5 +1,6 @@
 import os
 
+DEFAULT_CLONE_DEPTH = 'blobless'
 DEFAULT_LOCATION = os.path.expanduser('~/github-archive')
 DEFAULT_NUM_THREADS = 10
 DEFAULT_TIMEOUT = 300
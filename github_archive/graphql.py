@@ -0,0 +1,171 @@
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Optional
+
+import requests
+
+GITHUB_GRAPHQL_URL = 'https://api.github.com/graphql'
+GRAPHQL_PAGE_SIZE = 100
+GRAPHQL_TIMEOUT = 30
+
+# `repositoryOwner` resolves users and orgs alike, so one query serves both contexts.
+# `ownerAffiliations: OWNER` matches the REST listing this replaces, which returns
+# owned repos only — the GraphQL default would also include collaborator repos.
+REPOS_QUERY = """
+query ($login: String!, $cursor: String) {
+  repositoryOwner(login: $login) {
+    repositories(first: 100, after: $cursor, ownerAffiliations: OWNER) {
+      pageInfo {
+        hasNextPage
+        endCursor
+      }
+      nodes {
+        id
+        name
+        sshUrl
+        url
+        isFork
+        pushedAt
+        owner {
+          login
+        }
+        defaultBranchRef {
+          name
+          target {
+            oid
+          }
+        }
+      }
+    }
+  }
+}
+"""
+
+GISTS_QUERY = """
+query ($login: String!, $cursor: String) {
+  user(login: $login) {
+    gists(first: 100, after: $cursor, privacy: ALL) {
+      pageInfo {
+        hasNextPage
+        endCursor
+      }
+      nodes {
+        name
+        url
+        isFork
+        owner {
+          login
+        }
+      }
+    }
+  }
+}
+"""
+
+
+@dataclass(frozen=True)
+class GitAssetOwner:
+    login: str
+
+
+@dataclass(frozen=True)
+class GitAsset:
+    """The minimal set of git asset (repo, gist) fields the tool reads downstream,
+    populated from a GraphQL response instead of a full PyGithub object.
+    """
+
+    id: str
+    name: str
+    owner: GitAssetOwner
+    ssh_url: Optional[str] = None
+    html_url: Optional[str] = None
+    fork: bool = False
+    default_branch: Optional[str] = None
+    default_branch_oid: Optional[str] = None
+    pushed_at: Optional[datetime] = None
+
+
+def get_repos(token, owner):
+    """Retrieve every repo of a user or org with one GraphQL request per 100 repos,
+    returning only the fields the tool reads instead of full REST payloads.
+    """
+    repos = []
+    for node in _paginate(token, REPOS_QUERY, owner, ('repositoryOwner', 'repositories')):
+        default_branch_ref = node.get('defaultBranchRef') or {}
+        repos.append(
+            GitAsset(
+                id=node['id'],
+                name=node['name'],
+                owner=GitAssetOwner(login=node['owner']['login']),
+                ssh_url=node['sshUrl'],
+                html_url=node['url'],
+                fork=node['isFork'],
+                default_branch=default_branch_ref.get('name'),
+                default_branch_oid=(default_branch_ref.get('target') or {}).get('oid'),
+                pushed_at=_parse_datetime(node.get('pushedAt')),
+            )
+        )
+
+    return repos
+
+
+def get_gists(token, owner):
+    """Retrieve every gist of a user with one GraphQL request per 100 gists."""
+    gists = []
+    for node in _paginate(token, GISTS_QUERY, owner, ('user', 'gists')):
+        gists.append(
+            GitAsset(
+                id=node['name'],
+                name=node['name'],
+                owner=GitAssetOwner(login=node['owner']['login']),
+                html_url=node['url'],
+                fork=node['isFork'],
+            )
+        )
+
+    return gists
+
+
+def _parse_datetime(value):
+    """GraphQL timestamps are ISO-8601 in UTC; normalize them to the naive UTC
+    datetimes PyGithub uses so downstream comparisons work on either listing path.
+    """
+    if not value:
+        return None
+
+    return datetime.fromisoformat(value.replace('Z', '+00:00')).replace(tzinfo=None)
+
+
+def _paginate(token, query, owner, connection_path):
+    """Yield every node of a paginated GraphQL connection, following cursors until
+    the last page.
+    """
+    session = requests.Session()
+    session.headers['Authorization'] = f'token {token}'
+    cursor = None
+
+    while True:
+        response = session.post(
+            GITHUB_GRAPHQL_URL,
+            json={'query': query, 'variables': {'login': owner, 'cursor': cursor}},
+            timeout=GRAPHQL_TIMEOUT,
+        )
+        response.raise_for_status()
+        payload = response.json()
+
+        if payload.get('errors'):
+            raise ValueError(f'GitHub GraphQL error: {payload["errors"]}')
+
+        connection = payload['data']
+        for key in connection_path:
+            connection = connection[key] if connection else None
+        if not connection:
+            return
+
+        for node in connection['nodes']:
+            if node:
+                yield node
+
+        if not connection['pageInfo']['hasNextPage']:
+            return
+        cursor = connection['pageInfo']['endCursor']
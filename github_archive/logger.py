@@ -1,6 +1,8 @@
+import atexit
 import logging
 import logging.handlers
 import os
+import queue
 
 # 200kb * 5 files = 1mb of logs
 LOG_MAX_BYTES = 200000  # 200kb
@@ -10,7 +12,12 @@ LOG_BACKUP_COUNT = 5
 class Logger:
     @staticmethod
     def setup_logging(logger, location):
-        """Setup project logging (to console and log file)"""
+        """Setup project logging (to console and log file)
+
+        Log records are routed through a queue drained by a single listener thread
+        so the archive workers only enqueue records instead of contending for
+        handler locks and blocking on file/console writes.
+        """
         log_path = os.path.join(location, 'logs')
         log_file = os.path.join(log_path, 'github-archive.log')
 
@@ -18,12 +25,16 @@ class Logger:
             os.makedirs(log_path)
 
         logger.setLevel(logging.INFO)
-        handler = logging.handlers.RotatingFileHandler(
+        file_handler = logging.handlers.RotatingFileHandler(
             log_file,
             maxBytes=LOG_MAX_BYTES,
             backupCount=LOG_BACKUP_COUNT,
         )
         formatter = logging.Formatter("%(asctime)s - %(levelname)s - %(message)s")
-        handler.setFormatter(formatter)
-        logger.addHandler(logging.StreamHandler())
-        logger.addHandler(handler)
+        file_handler.setFormatter(formatter)
+
+        log_queue = queue.SimpleQueue()
+        listener = logging.handlers.QueueListener(log_queue, logging.StreamHandler(), file_handler)
+        listener.start()
+        atexit.register(listener.stop)
+        logger.addHandler(logging.handlers.QueueHandler(log_queue))
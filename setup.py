@@ -5,6 +5,7 @@ with open('README.md', 'r') as fh:
 
 REQUIREMENTS = [
     'PyGithub == 1.*',
+    'requests == 2.*',
 ]
 
 DEV_REQUIREMENTS = [
@@ -1,24 +1,24 @@
+import asyncio
+import io
+import os
 import subprocess
-from threading import BoundedSemaphore
-from unittest.mock import patch
+import tarfile
+from datetime import datetime
+from unittest.mock import MagicMock, patch
 
 import pytest
 from github_archive import GithubArchive
 from github_archive.archive import (
     CLONE_OPERATION,
-    DEFAULT_NUM_THREADS,
     GIST_CONTEXT,
+    GIT_CONFIG_ARGS,
     ORG_CONTEXT,
     PERSONAL_CONTEXT,
     PULL_OPERATION,
+    TARBALL_OPERATION,
     USER_CONTEXT,
 )
-
-
-def mock_thread_limiter():
-    thread_limiter = BoundedSemaphore(DEFAULT_NUM_THREADS)
-
-    return thread_limiter
+from github_archive.graphql import GitAsset, GitAssetOwner
 
 
 @patch('github_archive.archive.Github.get_user')
@@ -82,6 +82,45 @@ def test_run_token_pull(
     assert github_archive.users == []  # Assert the authed user gets removed from list
 
 
+@patch('github_archive.archive.Github.get_user')
+@patch('github_archive.archive.GithubArchive.view_repos')
+@patch('github_archive.archive.GithubArchive.get_all_git_assets')
+def test_run_token_not_in_users_skips_personal(mock_get_all_git_assets, mock_view_repos, mock_get_user):
+    github_archive = GithubArchive(
+        token='123',
+        users='someone_else',
+        view=True,
+    )
+
+    github_archive.authenticated_username = 'justintime50'
+    github_archive.run()
+
+    # Only the users listing runs, the personal branch (and its API call) is skipped
+    mock_get_all_git_assets.assert_called_once()
+    assert github_archive.users == ['someone_else']
+
+
+@patch('github_archive.archive.Github.get_user')
+@patch('github_archive.archive.GithubArchive.view_repos')
+@patch('github_archive.archive.GithubArchive.get_all_git_assets')
+def test_run_token_coalesces_personal_and_user_repos(
+    mock_get_all_git_assets, mock_view_repos, mock_get_user, mock_git_asset
+):
+    mock_get_all_git_assets.return_value = [mock_git_asset]
+    github_archive = GithubArchive(
+        token='123',
+        users='justintime50,someone_else',
+        view=True,
+    )
+
+    github_archive.authenticated_username = 'justintime50'
+    github_archive.run()
+
+    # The personal and user passes returned the same repo, it only gets archived once
+    assert mock_get_all_git_assets.call_count == 2
+    mock_view_repos.assert_called_once_with([mock_git_asset])
+
+
 @patch('github_archive.archive.GithubArchive.view_repos')
 @patch('github_archive.archive.GithubArchive.get_all_git_assets')
 def test_run_users_view(mock_get_all_git_assets, mock_view_repos):
@@ -118,6 +157,79 @@ def test_run_users_pull(mock_get_all_git_assets, mock_iterate_repos_to_archive):
     mock_iterate_repos_to_archive.assert_called_once()
 
 
+@patch('github_archive.archive.GithubArchive.iterate_repos_to_archive')
+@patch('github_archive.archive.GithubArchive.get_all_git_assets')
+def test_run_users_tarball(mock_get_all_git_assets, mock_iterate_repos_to_archive):
+    GithubArchive(
+        users='justintime50',
+        tarball=True,
+    ).run()
+
+    mock_get_all_git_assets.assert_called_once()
+    mock_iterate_repos_to_archive.assert_called_once()
+
+
+@patch('github_archive.archive.GithubArchive._write_last_run')
+@patch('github_archive.archive.GithubArchive.view_repos')
+@patch('github_archive.archive.GithubArchive.get_all_git_assets')
+def test_run_view_only_does_not_record_last_run(mock_get_all_git_assets, mock_view_repos, mock_write_last_run):
+    GithubArchive(
+        users='justintime50',
+        view=True,
+    ).run()
+
+    mock_write_last_run.assert_not_called()
+
+
+@patch('github_archive.archive.GithubArchive._write_last_run')
+@patch('github_archive.archive.GithubArchive._archive_repos')
+@patch('github_archive.archive.GithubArchive.get_all_git_assets')
+def test_run_clone_only_does_not_record_last_run(mock_get_all_git_assets, mock_archive_repos, mock_write_last_run):
+    # Clone passes skip existing repos without updating them, so they must not
+    # arm the pull-skip timestamp
+    GithubArchive(
+        users='justintime50',
+        clone=True,
+    ).run()
+
+    mock_write_last_run.assert_not_called()
+
+
+@patch('github_archive.archive.GithubArchive._write_last_run')
+@patch('github_archive.archive.GithubArchive._archive_repos')
+@patch('github_archive.archive.GithubArchive.get_all_git_assets')
+def test_run_pull_records_last_run(mock_get_all_git_assets, mock_archive_repos, mock_write_last_run):
+    GithubArchive(
+        users='justintime50',
+        pull=True,
+    ).run()
+
+    mock_write_last_run.assert_called_once()
+
+
+@patch('github_archive.archive.GithubArchive._write_last_run')
+@patch('github_archive.archive.GithubArchive._archive_repos')
+@patch('github_archive.archive.GithubArchive.get_all_git_assets')
+def test_run_pull_failures_do_not_record_last_run(mock_get_all_git_assets, mock_archive_repos, mock_write_last_run):
+    github_archive = GithubArchive(
+        users='justintime50',
+        pull=True,
+    )
+
+    github_archive._archive_failures = 1
+    github_archive.run()
+
+    mock_write_last_run.assert_not_called()
+
+
+def test_write_last_run_records_given_timestamp(tmp_path):
+    # run() passes its own start time so pushes landing mid-run stay eligible
+    github_archive = GithubArchive(location=str(tmp_path))
+    github_archive._write_last_run(datetime(2021, 8, 1, 12))
+
+    assert github_archive._read_last_run() == datetime(2021, 8, 1, 12)
+
+
 @patch('github_archive.archive.GithubArchive.view_repos')
 @patch('github_archive.archive.GithubArchive.get_all_git_assets')
 def test_run_orgs_view(mock_get_all_git_assets, mock_view_repos):
@@ -226,12 +338,16 @@ def test_run_stars_pull(mock_get_all_git_assets, mock_iterate_repos_to_archive):
     mock_iterate_repos_to_archive.assert_called_once()
 
 
+@patch('github_archive.archive.GithubArchive._start_trash_reaper')
+@patch('github_archive.archive.setup_api_cache')
 @patch('os.path.exists', return_value=False)
 @patch('os.makedirs')
-def test_initialize_project(mock_make_dirs, mock_dir_exist):
+def test_initialize_project(mock_make_dirs, mock_dir_exist, mock_setup_api_cache, mock_start_trash_reaper):
     GithubArchive().initialize_project()
 
-    assert mock_make_dirs.call_count == 2
+    assert mock_make_dirs.call_count == 3
+    mock_setup_api_cache.assert_called_once()
+    mock_start_trash_reaper.assert_called_once()
 
 
 @patch('github_archive.archive.LOGGER')
@@ -260,6 +376,30 @@ def test_initialize_project_missing_operation(mock_logger):
     assert message == str(error.value)
 
 
+@patch('github_archive.archive.LOGGER')
+def test_initialize_project_bad_clone_depth(mock_logger):
+    message = 'The clone depth must be one of: full, blobless, treeless, shallow.'
+    with pytest.raises(ValueError) as error:
+        GithubArchive(
+            users='justintime50',
+            clone=True,
+            clone_depth='everything',
+        ).initialize_project()
+
+    mock_logger.critical.assert_called_with(message)
+    assert message == str(error.value)
+
+
+def test_parse_owner_list_dedupes_and_strips():
+    github_archive = GithubArchive(users='Alice, alice,bob,,alice,')
+
+    assert github_archive.users == ['alice', 'bob']
+
+
+def test_parse_owner_list_empty():
+    assert GithubArchive().users == []
+
+
 @patch('github_archive.archive.Github.get_user')
 def test_authenticated_user_in_users(mock_get_user):
     authenticated_user_in_users = GithubArchive(
@@ -279,6 +419,17 @@ def test_get_all_git_assets(mock_get_user):
     mock_get_user.assert_called_once()
 
 
+@patch('github_archive.archive.Github.get_user')
+def test_get_all_git_assets_returns_concrete_list(mock_get_user):
+    git_assets = GithubArchive(
+        users='justintime50',
+    ).get_all_git_assets(USER_CONTEXT)
+
+    # A concrete list (not a lazy `PaginatedList`) means passing the same result to
+    # both view and clone/pull only iterates the GitHub pagination once
+    assert isinstance(git_assets, list)
+
+
 @patch('github_archive.archive.Github')
 @patch('github_archive.archive.Github.get_repos')
 @patch('github_archive.archive.Github.get_user')
@@ -321,9 +472,12 @@ def test_get_get_all_gists(mock_get_user, mock_get_gists, mock_github_instance):
     # TODO: Assert the list returned
 
 
+@patch('github_archive.archive.GithubArchive._prefetch_repos')
 @patch('github_archive.archive.Github')
 @patch('github_archive.archive.GithubArchive.archive_repo')
-def test_iterate_repos_not_matching_authed_username(mock_archive_repo, mock_github_instance, mock_git_asset):
+def test_iterate_repos_not_matching_authed_username(
+    mock_archive_repo, mock_github_instance, mock_prefetch_repos, mock_git_asset
+):
     repos = [mock_git_asset]
     GithubArchive(
         users='mock_username',
@@ -332,9 +486,12 @@ def test_iterate_repos_not_matching_authed_username(mock_archive_repo, mock_gith
     mock_archive_repo.assert_called_once()
 
 
+@patch('github_archive.archive.GithubArchive._prefetch_repos')
 @patch('github_archive.archive.Github')
 @patch('github_archive.archive.GithubArchive.archive_repo')
-def test_iterate_repos_matching_authed_username(mock_archive_repo, mock_github_instance, mock_git_asset):
+def test_iterate_repos_matching_authed_username(
+    mock_archive_repo, mock_github_instance, mock_prefetch_repos, mock_git_asset
+):
     repos = [mock_git_asset]
     GithubArchive(
         token='123',
@@ -344,6 +501,62 @@ def test_iterate_repos_matching_authed_username(mock_archive_repo, mock_github_i
     mock_archive_repo.assert_called_once()
 
 
+@patch('github_archive.archive.GithubArchive.archive_repo')
+def test_iterate_repos_pull_skips_unpushed_since_last_run(mock_archive_repo, mock_git_asset, tmp_path):
+    (tmp_path / '.last_run').write_text(datetime(2021, 8, 1).isoformat())
+    mock_git_asset.pushed_at = datetime(2021, 7, 1)
+
+    GithubArchive(
+        location=str(tmp_path),
+    ).iterate_repos_to_archive([mock_git_asset], USER_CONTEXT, PULL_OPERATION)
+
+    mock_archive_repo.assert_not_called()
+
+
+@patch('github_archive.archive.GithubArchive.archive_repo')
+def test_iterate_repos_pull_keeps_recently_pushed(mock_archive_repo, mock_git_asset, tmp_path):
+    (tmp_path / '.last_run').write_text(datetime(2021, 8, 1).isoformat())
+    mock_git_asset.pushed_at = datetime(2021, 9, 1)
+
+    GithubArchive(
+        location=str(tmp_path),
+    ).iterate_repos_to_archive([mock_git_asset], USER_CONTEXT, PULL_OPERATION)
+
+    mock_archive_repo.assert_called_once()
+
+
+@patch('github_archive.archive.GithubArchive._prefetch_repos')
+@patch('github_archive.archive.GithubArchive.archive_repo')
+def test_iterate_repos_clone_prefetches_missing_repos(mock_archive_repo, mock_prefetch_repos, mock_git_asset, tmp_path):
+    GithubArchive(
+        location=str(tmp_path),
+    ).iterate_repos_to_archive([mock_git_asset], USER_CONTEXT, CLONE_OPERATION)
+
+    mock_prefetch_repos.assert_called_once_with([mock_git_asset])
+
+
+@patch('github_archive.archive.GithubArchive._prefetch_repos')
+@patch('github_archive.archive.GithubArchive.archive_repo')
+def test_iterate_repos_pull_does_not_prefetch(mock_archive_repo, mock_prefetch_repos, mock_git_asset, tmp_path):
+    GithubArchive(
+        location=str(tmp_path),
+    ).iterate_repos_to_archive([mock_git_asset], USER_CONTEXT, PULL_OPERATION)
+
+    mock_prefetch_repos.assert_not_called()
+
+
+def test_pushed_since_graphql_asset():
+    repo = GitAsset(
+        id='123',
+        name='mock-asset-name',
+        owner=GitAssetOwner(login='mock_username'),
+        pushed_at=datetime(2021, 7, 1),
+    )
+
+    assert GithubArchive()._pushed_since(repo, datetime(2021, 8, 1)) is False
+    assert GithubArchive()._pushed_since(repo, datetime(2021, 6, 1)) is True
+
+
 @patch('github_archive.archive.Github')
 @patch('github_archive.archive.GithubArchive.archive_gist')
 def test_iterate_gists(mock_archive_gist, mock_github_instance, mock_git_asset):
@@ -371,95 +584,370 @@ def test_view_gists(mock_logger, mock_git_asset):
     mock_logger.info.assert_called_with('mock_username/123')
 
 
-@patch('subprocess.run')
+@patch('github_archive.archive.GithubArchive._run_git')
 @patch('github_archive.archive.LOGGER')
-def test_archive_repo_success(mock_logger, mock_subprocess, mock_git_asset):
-    # TODO: Mock the subprocess better to ensure it's doing what it should
+def test_archive_repo_success(mock_logger, mock_run_git, mock_git_asset):
+    # TODO: Mock the git subprocess better to ensure it's doing what it should
     operation = CLONE_OPERATION
     message = f'Repo: {mock_git_asset.owner.login}/{mock_git_asset.name} {operation} success!'
-    GithubArchive().archive_repo(mock_thread_limiter(), mock_git_asset, 'mock/path', operation)
+    asyncio.run(GithubArchive().archive_repo(mock_git_asset, 'mock/path', operation, already_exists=False))
 
-    mock_subprocess.assert_called()
+    mock_run_git.assert_called()
     mock_logger.info.assert_called_once_with(message)
 
 
-@patch('os.path.exists', return_value=True)
-@patch('subprocess.run')
+@patch('github_archive.archive.GithubArchive._run_git')
 @patch('github_archive.archive.LOGGER')
-def test_archive_repo_clone_exists(mock_logger, mock_subprocess, mock_git_asset):
+def test_archive_repo_clone_exists(mock_logger, mock_run_git, mock_git_asset):
     operation = CLONE_OPERATION
-    GithubArchive().archive_repo(mock_thread_limiter(), mock_git_asset, 'assets', operation)
+    asyncio.run(GithubArchive().archive_repo(mock_git_asset, 'assets', operation, already_exists=True))
 
-    mock_subprocess.assert_not_called()
+    mock_run_git.assert_not_called()
 
 
-@patch('shutil.rmtree')
-@patch('subprocess.run', side_effect=subprocess.TimeoutExpired(cmd=subprocess.run, timeout=0.1))
+@patch('os.rename')
+@patch('github_archive.archive.GithubArchive._run_git', side_effect=asyncio.TimeoutError())
 @patch('github_archive.archive.LOGGER')
-def test_archive_repo_timeout_exception(mock_logger, mock_subprocess, mock_remove_dir, mock_git_asset):
+def test_archive_repo_timeout_exception(mock_logger, mock_run_git, mock_trash_dir, mock_git_asset):
     operation = CLONE_OPERATION
     message = f'Git operation timed out archiving {mock_git_asset.name}.'
-    GithubArchive().archive_repo(mock_thread_limiter(), mock_git_asset, 'mock/path', operation)
+    asyncio.run(GithubArchive().archive_repo(mock_git_asset, 'mock/path', operation, already_exists=False))
 
     mock_logger.error.assert_called_with(message)
-    # TODO: This is difficult to mock because it must not exist and then later exist in the same function
-    # mock_remove_dir.assert_called_once_with('mock/path')
+    assert mock_trash_dir.call_args[0][0] == 'mock/path'
 
 
-@patch('shutil.rmtree')
-@patch('subprocess.run', side_effect=subprocess.CalledProcessError(returncode=1, cmd=subprocess.run))
+@patch('os.rename')
+@patch(
+    'github_archive.archive.GithubArchive._run_git', side_effect=subprocess.CalledProcessError(returncode=1, cmd='git')
+)
 @patch('github_archive.archive.LOGGER')
-def test_archive_repo_called_process_error(mock_logger, mock_subprocess, mock_remove_dir, mock_git_asset):
+def test_archive_repo_called_process_error(mock_logger, mock_run_git, mock_trash_dir, mock_git_asset):
     operation = PULL_OPERATION
-    GithubArchive().archive_repo(mock_thread_limiter(), mock_git_asset, 'assets', operation)
+    github_archive = GithubArchive()
+    asyncio.run(github_archive.archive_repo(mock_git_asset, 'assets', operation, already_exists=True))
 
     mock_logger.error.assert_called()
-    # TODO: This is difficult to mock because it must not exist and then later exist in the same function
-    # mock_remove_dir.assert_called_once_with('mock/path')
+    assert mock_trash_dir.call_args[0][0] == 'assets'
+    assert github_archive._archive_failures == 1  # Failed repos block recording `.last_run`
+
+
+@patch('github_archive.archive.GithubArchive._run_git')
+@patch('github_archive.archive.LOGGER')
+def test_archive_repo_clone_depth(mock_logger, mock_run_git, mock_git_asset):
+    asyncio.run(GithubArchive().archive_repo(mock_git_asset, 'mock/path', CLONE_OPERATION, already_exists=False))
+    blobless_command = mock_run_git.call_args[0][0]
+
+    assert '--filter=blob:none' in blobless_command
+
+    asyncio.run(
+        GithubArchive(clone_depth='shallow').archive_repo(
+            mock_git_asset, 'mock/path', CLONE_OPERATION, already_exists=False
+        )
+    )
+    shallow_command = mock_run_git.call_args[0][0]
+
+    assert '--depth=1' in shallow_command
+
+    asyncio.run(
+        GithubArchive(clone_depth='full').archive_repo(
+            mock_git_asset, 'mock/path', CLONE_OPERATION, already_exists=False
+        )
+    )
+    full_command = mock_run_git.call_args[0][0]
+
+    assert full_command == ['git', *GIT_CONFIG_ARGS, 'clone', mock_git_asset.ssh_url, 'mock/path']
+
+
+def test_git_env_enables_ssh_multiplexing(tmp_path):
+    with patch.dict('os.environ', clear=False):
+        os.environ.pop('GIT_SSH_COMMAND', None)
+        git_env = GithubArchive(location=str(tmp_path))._git_env()
+
+    assert 'ControlMaster=auto' in git_env['GIT_SSH_COMMAND']
+    assert os.path.exists(tmp_path / '.ssh_sockets')
+
+
+def test_git_env_respects_user_ssh_command(tmp_path):
+    with patch.dict('os.environ', {'GIT_SSH_COMMAND': 'ssh -i my-key'}):
+        git_env = GithubArchive(location=str(tmp_path))._git_env()
+
+    assert git_env is None
+
+
+def mock_tarball_bytes():
+    tarball_buffer = io.BytesIO()
+    with tarfile.open(fileobj=tarball_buffer, mode='w:gz') as tarball:
+        readme = b'# Mock Asset'
+        member = tarfile.TarInfo('mock-asset-name-123abc/README.md')
+        member.size = len(readme)
+        tarball.addfile(member, io.BytesIO(readme))
+
+    return tarball_buffer.getvalue()
+
+
+@patch('requests.get')
+@patch('github_archive.archive.LOGGER')
+def test_download_tarball(mock_logger, mock_requests_get, mock_git_asset, tmp_path):
+    mock_response = MagicMock(status_code=200)
+    mock_response.headers = {'ETag': 'W/"abc"'}
+    mock_response.iter_content.return_value = [mock_tarball_bytes()]
+    mock_requests_get.return_value = mock_response
+    repo_path = tmp_path / 'repos' / 'mock_username' / 'mock-asset-name'
+
+    GithubArchive()._download_tarball(mock_git_asset, str(repo_path))
+
+    # The tarball's wrapping dir gets stripped so contents land in the repo dir
+    assert (repo_path / 'README.md').read_text() == '# Mock Asset'
+    assert (tmp_path / 'repos' / 'mock_username' / 'mock-asset-name.etag').read_text() == 'W/"abc"'
+
+
+def mock_malicious_tarball_bytes():
+    tarball_buffer = io.BytesIO()
+    with tarfile.open(fileobj=tarball_buffer, mode='w:gz') as tarball:
+        payload = b'evil'
+        traversal_member = tarfile.TarInfo('mock-asset-name-123abc/../../escaped.txt')
+        traversal_member.size = len(payload)
+        tarball.addfile(traversal_member, io.BytesIO(payload))
+
+        symlink_member = tarfile.TarInfo('mock-asset-name-123abc/link')
+        symlink_member.type = tarfile.SYMTYPE
+        symlink_member.linkname = '../../'
+        tarball.addfile(symlink_member)
+
+        readme = b'# Mock Asset'
+        member = tarfile.TarInfo('mock-asset-name-123abc/README.md')
+        member.size = len(readme)
+        tarball.addfile(member, io.BytesIO(readme))
+
+    return tarball_buffer.getvalue()
+
+
+@patch('requests.get')
+@patch('github_archive.archive.LOGGER')
+def test_download_tarball_skips_unsafe_members(mock_logger, mock_requests_get, mock_git_asset, tmp_path):
+    mock_response = MagicMock(status_code=200)
+    mock_response.headers = {}
+    mock_response.iter_content.return_value = [mock_malicious_tarball_bytes()]
+    mock_requests_get.return_value = mock_response
+    repo_path = tmp_path / 'repos' / 'mock_username' / 'mock-asset-name'
+
+    GithubArchive()._download_tarball(mock_git_asset, str(repo_path))
+
+    # Members escaping the repo dir (tar-slip) and symlinks are dropped, the rest extracts
+    assert (repo_path / 'README.md').read_text() == '# Mock Asset'
+    assert not (tmp_path / 'repos' / 'escaped.txt').exists()
+    assert not (repo_path / 'link').exists()
+
+
+@patch('requests.get')
+@patch('github_archive.archive.LOGGER')
+def test_download_tarball_304_skips_download(mock_logger, mock_requests_get, mock_git_asset, tmp_path):
+    mock_response = MagicMock(status_code=304)
+    mock_requests_get.return_value = mock_response
+    repo_path = tmp_path / 'repos' / 'mock_username' / 'mock-asset-name'
+    repo_path.parent.mkdir(parents=True)
+    (tmp_path / 'repos' / 'mock_username' / 'mock-asset-name.etag').write_text('W/"abc"')
+
+    GithubArchive()._download_tarball(mock_git_asset, str(repo_path))
 
+    request_headers = mock_requests_get.call_args[1]['headers']
+    assert request_headers['If-None-Match'] == 'W/"abc"'
+    mock_response.iter_content.assert_not_called()
 
-@patch('subprocess.run')
+
+@patch('github_archive.archive.GithubArchive._download_tarball')
+@patch('github_archive.archive.LOGGER')
+def test_archive_repo_tarball(mock_logger, mock_download_tarball, mock_git_asset):
+    asyncio.run(GithubArchive().archive_repo(mock_git_asset, 'mock/path', TARBALL_OPERATION, already_exists=False))
+
+    mock_download_tarball.assert_called_once()
+
+
+@patch('github_archive.archive.GithubArchive._run_git')
+def test_prefetch_repos(mock_run_git, mock_git_asset, tmp_path):
+    github_archive = GithubArchive(location=str(tmp_path))
+    asyncio.run(github_archive._prefetch_repos([mock_git_asset]))
+
+    fetch_command = mock_run_git.call_args[0][0]
+
+    assert '--multiple' in fetch_command
+    assert 'mock_username-mock-asset-name' in fetch_command
+    store_config = (tmp_path / '.multi.git' / 'config').read_text()
+    assert '[remote "mock_username-mock-asset-name"]' in store_config
+    # The default blobless depth must carry over to the store's fetches
+    assert 'promisor = true' in store_config
+    assert 'partialclonefilter = blob:none' in store_config
+
+
+@patch('github_archive.archive.GithubArchive._run_git')
+def test_prefetch_repos_skipped_for_shallow_depth(mock_run_git, mock_git_asset, tmp_path):
+    github_archive = GithubArchive(location=str(tmp_path), clone_depth='shallow')
+    asyncio.run(github_archive._prefetch_repos([mock_git_asset]))
+
+    mock_run_git.assert_not_called()
+    assert not (tmp_path / '.multi.git').exists()
+
+
+@patch('github_archive.archive.GithubArchive._run_git')
+def test_prefetch_repos_full_depth_has_no_filter(mock_run_git, mock_git_asset, tmp_path):
+    github_archive = GithubArchive(location=str(tmp_path), clone_depth='full')
+    asyncio.run(github_archive._prefetch_repos([mock_git_asset]))
+
+    store_config = (tmp_path / '.multi.git' / 'config').read_text()
+    assert 'partialclonefilter' not in store_config
+
+
+@patch('github_archive.archive.LOGGER')
+@patch(
+    'github_archive.archive.GithubArchive._run_git', side_effect=subprocess.CalledProcessError(returncode=1, cmd='git')
+)
+def test_prefetch_repos_failure_is_best_effort(mock_run_git, mock_logger, mock_git_asset, tmp_path):
+    github_archive = GithubArchive(location=str(tmp_path))
+    asyncio.run(github_archive._prefetch_repos([mock_git_asset]))
+
+    mock_logger.debug.assert_called()
+
+
+def test_cleanup_failed_archive_moves_to_trash(tmp_path):
+    github_archive = GithubArchive(location=str(tmp_path))
+    failed_path = tmp_path / 'repos' / 'mock_username' / 'mock-asset-name'
+    failed_path.mkdir(parents=True)
+    (tmp_path / '.trash').mkdir()
+
+    github_archive._cleanup_failed_archive(str(failed_path))
+
+    assert not failed_path.exists()
+    assert len(list((tmp_path / '.trash').iterdir())) == 1
+
+
+def test_snapshot_existing_repos(mock_git_asset, tmp_path):
+    owner_dir = tmp_path / 'repos' / 'mock_username'
+    owner_dir.mkdir(parents=True)
+    (owner_dir / 'mock-asset-name').mkdir()
+
+    existing_repo_paths = GithubArchive(location=str(tmp_path))._snapshot_existing_repos([mock_git_asset])
+
+    assert existing_repo_paths == {str(owner_dir / 'mock-asset-name')}
+
+
+def test_snapshot_existing_repos_missing_owner_dir(mock_git_asset, tmp_path):
+    existing_repo_paths = GithubArchive(location=str(tmp_path))._snapshot_existing_repos([mock_git_asset])
+
+    assert existing_repo_paths == set()
+
+
+@patch('github_archive.archive.GithubArchive._repo_up_to_date', return_value=False)
+@patch('github_archive.archive.GithubArchive._run_git')
+@patch('github_archive.archive.LOGGER')
+def test_archive_repo_pull_runs_in_repo_dir(mock_logger, mock_run_git, mock_repo_up_to_date, mock_git_asset):
+    asyncio.run(GithubArchive().archive_repo(mock_git_asset, 'mock/path', PULL_OPERATION, already_exists=True))
+
+    assert mock_run_git.call_args[0][0] == ['git', *GIT_CONFIG_ARGS, 'pull', '--rebase']
+    assert mock_run_git.call_args[1]['cwd'] == 'mock/path'
+
+
+@patch('github_archive.archive.GithubArchive._run_git')
+@patch('github_archive.archive.GithubArchive._repo_up_to_date', return_value=True)
+@patch('github_archive.archive.LOGGER')
+def test_archive_repo_pull_up_to_date(mock_logger, mock_repo_up_to_date, mock_run_git, mock_git_asset):
+    operation = PULL_OPERATION
+    asyncio.run(GithubArchive().archive_repo(mock_git_asset, 'assets', operation, already_exists=True))
+
+    mock_run_git.assert_not_called()
+
+
+@patch('github_archive.archive.GithubArchive._remote_head_sha', return_value='123abc')
+def test_repo_up_to_date_matching_shas(mock_remote_head_sha, mock_git_asset, tmp_path):
+    mock_git_asset.default_branch_oid = None
+    git_dir = tmp_path / '.git'
+    git_dir.mkdir()
+    (git_dir / 'HEAD').write_text('ref: refs/heads/main\n')
+    (git_dir / 'refs' / 'heads').mkdir(parents=True)
+    (git_dir / 'refs' / 'heads' / 'main').write_text('123abc\n')
+
+    up_to_date = asyncio.run(GithubArchive()._repo_up_to_date(mock_git_asset, str(tmp_path)))
+
+    assert up_to_date is True
+
+
+@patch('github_archive.archive.GithubArchive._remote_head_sha', return_value='456def')
+def test_repo_up_to_date_stale_local_sha(mock_remote_head_sha, mock_git_asset, tmp_path):
+    mock_git_asset.default_branch_oid = None
+    git_dir = tmp_path / '.git'
+    git_dir.mkdir()
+    (git_dir / 'HEAD').write_text('ref: refs/heads/main\n')
+    (git_dir / 'packed-refs').write_text('123abc refs/heads/main\n')
+
+    up_to_date = asyncio.run(GithubArchive()._repo_up_to_date(mock_git_asset, str(tmp_path)))
+
+    assert up_to_date is False
+
+
+@patch('github_archive.archive.GithubArchive._remote_head_sha')
+def test_repo_up_to_date_uses_listed_oid(mock_remote_head_sha, mock_git_asset, tmp_path):
+    mock_git_asset.default_branch_oid = '123abc'
+    git_dir = tmp_path / '.git'
+    git_dir.mkdir()
+    (git_dir / 'HEAD').write_text('ref: refs/heads/main\n')
+    (git_dir / 'refs' / 'heads').mkdir(parents=True)
+    (git_dir / 'refs' / 'heads' / 'main').write_text('123abc\n')
+
+    up_to_date = asyncio.run(GithubArchive()._repo_up_to_date(mock_git_asset, str(tmp_path)))
+
+    assert up_to_date is True
+    mock_remote_head_sha.assert_not_called()
+
+
+@patch('github_archive.archive.GithubArchive._remote_head_sha')
+def test_repo_up_to_date_no_local_repo(mock_remote_head_sha, mock_git_asset, tmp_path):
+    up_to_date = asyncio.run(GithubArchive()._repo_up_to_date(mock_git_asset, str(tmp_path)))
+
+    assert up_to_date is False
+    mock_remote_head_sha.assert_not_called()
+
+
+@patch('github_archive.archive.GithubArchive._run_git')
 @patch('github_archive.archive.LOGGER')
-def test_archive_gist_success(mock_logger, mock_subprocess, mock_git_asset):
-    # TODO: Mock the subprocess better to ensure it's doing what it should
+def test_archive_gist_success(mock_logger, mock_run_git, mock_git_asset):
+    # TODO: Mock the git subprocess better to ensure it's doing what it should
     operation = CLONE_OPERATION
     message = f'Gist: {mock_git_asset.owner.login}/{mock_git_asset.id} {operation} success!'
-    GithubArchive().archive_gist(mock_thread_limiter(), mock_git_asset, 'mock/path', operation)
+    asyncio.run(GithubArchive().archive_gist(mock_git_asset, 'mock/path', operation, already_exists=False))
 
-    mock_subprocess.assert_called()
+    mock_run_git.assert_called()
     mock_logger.info.assert_called_once_with(message)
 
 
-@patch('os.path.exists', return_value=True)
-@patch('subprocess.run')
+@patch('github_archive.archive.GithubArchive._run_git')
 @patch('github_archive.archive.LOGGER')
-def test_archive_gist_clone_exists(mock_logger, mock_subprocess, mock_path_exists, mock_git_asset):
+def test_archive_gist_clone_exists(mock_logger, mock_run_git, mock_git_asset):
     operation = CLONE_OPERATION
-    GithubArchive().archive_gist(mock_thread_limiter(), mock_git_asset, 'assets', operation)
+    asyncio.run(GithubArchive().archive_gist(mock_git_asset, 'assets', operation, already_exists=True))
 
-    mock_subprocess.assert_not_called()
+    mock_run_git.assert_not_called()
 
 
-@patch('shutil.rmtree')
-@patch('subprocess.run', side_effect=subprocess.TimeoutExpired(cmd=subprocess.run, timeout=0.1))
+@patch('os.rename')
+@patch('github_archive.archive.GithubArchive._run_git', side_effect=asyncio.TimeoutError())
 @patch('github_archive.archive.LOGGER')
-def test_archive_gist_timeout_exception(mock_logger, mock_subprocess, mock_remove_dir, mock_git_asset):
+def test_archive_gist_timeout_exception(mock_logger, mock_run_git, mock_trash_dir, mock_git_asset):
     operation = CLONE_OPERATION
     message = f'Git operation timed out archiving {mock_git_asset.id}.'
-    GithubArchive().archive_gist(mock_thread_limiter(), mock_git_asset, 'mock/path', operation)
+    asyncio.run(GithubArchive().archive_gist(mock_git_asset, 'mock/path', operation, already_exists=False))
 
     mock_logger.error.assert_called_with(message)
-    # TODO: This is difficult to mock because it must not exist and then later exist in the same function
-    # mock_remove_dir.assert_called_once_with('mock/path')
+    assert mock_trash_dir.call_args[0][0] == 'mock/path'
 
 
-@patch('shutil.rmtree')
-@patch('subprocess.run', side_effect=subprocess.CalledProcessError(returncode=1, cmd=subprocess.run))
+@patch('os.rename')
+@patch(
+    'github_archive.archive.GithubArchive._run_git', side_effect=subprocess.CalledProcessError(returncode=1, cmd='git')
+)
 @patch('github_archive.archive.LOGGER')
-def test_archive_gist_called_process_error(mock_logger, mock_subprocess, mock_remove_dir, mock_git_asset):
+def test_archive_gist_called_process_error(mock_logger, mock_run_git, mock_trash_dir, mock_git_asset):
     operation = PULL_OPERATION
-    GithubArchive().archive_gist(mock_thread_limiter(), mock_git_asset, 'assets', operation)
+    asyncio.run(GithubArchive().archive_gist(mock_git_asset, 'assets', operation, already_exists=True))
 
     mock_logger.error.assert_called()
-    # TODO: This is difficult to mock because it must not exist and then later exist in the same function
-    # mock_remove_dir.assert_called_once_with('mock/path')
+    assert mock_trash_dir.call_args[0][0] == 'assets'
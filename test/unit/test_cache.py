@@ -0,0 +1,79 @@
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import MagicMock
+
+from github import Github
+from github_archive.cache import setup_api_cache
+
+
+def mock_requester(github_instance, return_value):
+    """Swap the requester's request function for a mock so no real HTTP calls are made."""
+    requester = github_instance._Github__requester
+    mock_request_encode = MagicMock(return_value=return_value)
+    requester._Requester__requestEncode = mock_request_encode
+
+    return requester, mock_request_encode
+
+
+def test_setup_api_cache_stores_and_serves_304(tmp_path):
+    github_instance = Github()
+    requester, mock_request_encode = mock_requester(github_instance, (200, {'ETag': 'W/"abc"'}, '{"foo": "bar"}'))
+
+    setup_api_cache(github_instance, str(tmp_path))
+
+    status, _, output = requester._Requester__requestEncode(None, 'GET', '/repos', None, None, None, None)
+
+    assert status == 200
+    assert output == '{"foo": "bar"}'
+
+    mock_request_encode.return_value = (304, {}, '')
+    status, _, output = requester._Requester__requestEncode(None, 'GET', '/repos', None, None, None, None)
+
+    assert status == 200
+    assert output == '{"foo": "bar"}'  # Served from the cache
+    sent_headers = mock_request_encode.call_args[0][4]
+    assert sent_headers['If-None-Match'] == 'W/"abc"'
+
+
+def test_setup_api_cache_ignores_non_get(tmp_path):
+    github_instance = Github()
+    requester, mock_request_encode = mock_requester(github_instance, (201, {'ETag': 'W/"abc"'}, '{"foo": "bar"}'))
+
+    setup_api_cache(github_instance, str(tmp_path))
+
+    requester._Requester__requestEncode(None, 'POST', '/repos', None, None, None, None)
+    requester._Requester__requestEncode(None, 'POST', '/repos', None, None, None, None)
+
+    sent_headers = mock_request_encode.call_args[0][4]
+    assert sent_headers is None
+
+
+def test_setup_api_cache_concurrent_requests(tmp_path):
+    """Listing calls fan out across a thread pool, so concurrent cached requests must
+    not corrupt the shelve DB (it doesn't support concurrent access on its own).
+    """
+    github_instance = Github()
+    requester, mock_request_encode = mock_requester(github_instance, (200, {'ETag': 'W/"abc"'}, '{"foo": "bar"}'))
+
+    setup_api_cache(github_instance, str(tmp_path))
+
+    def make_requests(thread_index):
+        for request_index in range(25):
+            url = f'/repos/{thread_index}/{request_index}'
+            requester._Requester__requestEncode(None, 'GET', url, None, None, None, None)
+
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        list(pool.map(make_requests, range(2)))
+
+    assert mock_request_encode.call_count == 50
+
+
+def test_setup_api_cache_unwritable_location(tmp_path):
+    """An unusable cache location must never fail the run, the cache is an optimization."""
+    github_instance = Github()
+    requester, mock_request_encode = mock_requester(github_instance, (200, {}, '{}'))
+    bad_location = tmp_path / 'not-a-dir'
+    bad_location.write_text('file in the way')
+
+    setup_api_cache(github_instance, str(bad_location))
+
+    assert requester._Requester__requestEncode is mock_request_encode
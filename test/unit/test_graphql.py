@@ -0,0 +1,110 @@
+from datetime import datetime
+from unittest.mock import patch
+
+import pytest
+from github_archive import graphql
+
+
+def mock_graphql_response(connection_path, nodes, has_next_page=False, end_cursor=None):
+    """Build a GraphQL response payload with the connection nested under the given path."""
+    connection = {
+        'pageInfo': {
+            'hasNextPage': has_next_page,
+            'endCursor': end_cursor,
+        },
+        'nodes': nodes,
+    }
+    data = connection
+    for key in reversed(connection_path):
+        data = {key: data}
+
+    return {'data': data}
+
+
+def mock_repo_node(name='mock-asset-name'):
+    return {
+        'id': '123',
+        'name': name,
+        'sshUrl': f'git@github.com:mock_username/{name}.git',
+        'url': f'https://github.com/mock_username/{name}',
+        'isFork': False,
+        'pushedAt': '2021-08-24T12:00:00Z',
+        'owner': {'login': 'mock_username'},
+        'defaultBranchRef': {'name': 'main', 'target': {'oid': '123abc'}},
+    }
+
+
+@patch('requests.Session.post')
+def test_get_repos(mock_post):
+    mock_post.return_value.json.return_value = mock_graphql_response(
+        ('repositoryOwner', 'repositories'), [mock_repo_node()]
+    )
+
+    repos = graphql.get_repos('123', 'mock_username')
+
+    assert len(repos) == 1
+    assert repos[0].name == 'mock-asset-name'
+    assert repos[0].owner.login == 'mock_username'
+    assert repos[0].ssh_url == 'git@github.com:mock_username/mock-asset-name.git'
+    assert repos[0].fork is False
+    assert repos[0].default_branch == 'main'
+    assert repos[0].default_branch_oid == '123abc'
+    assert repos[0].pushed_at == datetime(2021, 8, 24, 12)
+    # Match the REST listing's `type=owner` default, not GraphQL's OWNER+COLLABORATOR
+    assert 'ownerAffiliations: OWNER' in mock_post.call_args[1]['json']['query']
+
+
+@patch('requests.Session.post')
+def test_get_repos_paginated(mock_post):
+    mock_post.return_value.json.side_effect = [
+        mock_graphql_response(
+            ('repositoryOwner', 'repositories'), [mock_repo_node('repo1')], has_next_page=True, end_cursor='abc'
+        ),
+        mock_graphql_response(('repositoryOwner', 'repositories'), [mock_repo_node('repo2')]),
+    ]
+
+    repos = graphql.get_repos('123', 'mock_username')
+
+    assert mock_post.call_count == 2
+    assert [repo.name for repo in repos] == ['repo1', 'repo2']
+
+
+@patch('requests.Session.post')
+def test_get_repos_unknown_owner(mock_post):
+    mock_post.return_value.json.return_value = {'data': {'repositoryOwner': None}}
+
+    repos = graphql.get_repos('123', 'mock_username')
+
+    assert repos == []
+
+
+@patch('requests.Session.post')
+def test_get_gists(mock_post):
+    mock_post.return_value.json.return_value = mock_graphql_response(
+        ('user', 'gists'),
+        [
+            {
+                'name': '123',
+                'url': 'https://gist.github.com/mock_username/123',
+                'isFork': False,
+                'owner': {'login': 'mock_username'},
+            }
+        ],
+    )
+
+    gists = graphql.get_gists('123', 'mock_username')
+
+    assert len(gists) == 1
+    assert gists[0].id == '123'
+    assert gists[0].owner.login == 'mock_username'
+    assert gists[0].html_url == 'https://gist.github.com/mock_username/123'
+
+
+@patch('requests.Session.post')
+def test_paginate_graphql_errors(mock_post):
+    mock_post.return_value.json.return_value = {'errors': [{'message': 'Bad credentials'}]}
+
+    with pytest.raises(ValueError) as error:
+        graphql.get_repos('123', 'mock_username')
+
+    assert 'GitHub GraphQL error' in str(error.value)
@@ -1,3 +1,4 @@
+import logging.handlers
 import os
 from unittest.mock import mock_open, patch
 
@@ -29,3 +30,12 @@ def test_setup_logging_dir_exists(mock_logger, mock_make_dirs):
     mock_make_dirs.assert_not_called()
     mock_logger.setLevel.assert_called()
     mock_logger.addHandler.assert_called()
+
+
+@patch('os.makedirs')
+@patch('github_archive.archive.LOGGER')
+def test_setup_logging_uses_queue_handler(mock_logger, mock_make_dirs):
+    with patch('builtins.open', mock_open()):
+        Logger.setup_logging(mock_logger, LOG_PATH)
+    handler = mock_logger.addHandler.call_args[0][0]
+    assert isinstance(handler, logging.handlers.QueueHandler)